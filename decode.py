@@ -2,8 +2,10 @@
 """
 decode.py - Streaming template-based decoder (MVP)
 
-Reads template.bin written by encode.py (zlib-compressed JSON) and reconstructs
-the original byte sequence by expanding symbols and hierarchical rules.
+Reads template.bin written by encode.py (zstd- or zlib-compressed JSON, detected
+from the frame header) and reconstructs the original byte sequence by expanding
+symbols and hierarchical rules. zstd templates are decompressed as a stream and
+need the optional `zstandard` package.
 
 Supports context selection (e.g., VIDEO, TEXT) so a single symbol may have
 multiple possible expansions; decoder picks the expansion for the chosen context.
@@ -11,49 +13,139 @@ multiple possible expansions; decoder picks the expansion for the chosen context
 Usage:
   python3 decode.py --template template.bin --out reconstructed.bin --context VIDEO --verbose
 """
-import argparse, json, zlib, os
-from functools import lru_cache
+import argparse, base64, json, zlib, os, sys
+from array import array
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
 
-def decode_template(template_path, out_path, context="DEFAULT", verbose=False):
-    with open(template_path, "rb") as f:
-        blob = f.read()
-    txt = zlib.decompress(blob).decode("utf-8")
-    tpl = json.loads(txt)
-    dictionary = tpl.get("dictionary", {})
-    rules = tpl.get("rules", {})
-    seq_str = tpl.get("sequence", "")
-    if verbose:
-        print(f"[DEC] loaded template for file {tpl.get('meta',{}).get('orig_file')} chunks={tpl.get('meta',{}).get('total_chunks')}")
-        print(f"[DEC] dict entries: {len(dictionary)} rules: {len(rules)} sequence_symbols: {len(seq_str.split(',')) if seq_str else 0}")
-    @lru_cache(maxsize=65536)
-    def expand_symbol(sym):
-        if sym in dictionary:
-            e = dictionary[sym]
-            if context in e:
-                return bytes.fromhex(e[context])
-            if "DEFAULT" in e:
-                return bytes.fromhex(e["DEFAULT"])
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# template layout this decoder reads (int ids, dictionary list, int32 arrays);
+# templates without a format are from the original string-symbol encoder
+TEMPLATE_FORMAT = 2
+DEFAULT_FLUSH_SIZE = 4 << 20
+DEFAULT_MAX_CACHED = 1 << 20
+DEFAULT_CACHE_BUDGET = 256 << 20
+
+def load_int32(b64):
+    # base64 of little-endian int32 values -> array("i")
+    arr = array("i")
+    arr.frombytes(base64.b64decode(b64))
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+def resolve_terminals(dictionary, context):
+    # Pick and decode each entry's expansion once: the requested context, then
+    # DEFAULT, then the first value that is valid base64; b"" if none is.
+    terminals = []
+    for e in dictionary:
+        if context in e:
+            t = base64.b64decode(e[context])
+        elif "DEFAULT" in e:
+            t = base64.b64decode(e["DEFAULT"])
+        else:
+            t = b""
             for v in e.values():
                 try:
-                    return bytes.fromhex(v)
-                except:
+                    t = base64.b64decode(v, validate=True)
+                    break
+                except (TypeError, ValueError):
                     continue
-            return b""
-        if sym in rules:
-            a,b = rules[sym]
-            return expand_symbol(a) + expand_symbol(b)
-        return b""
-    seq = seq_str.split(",") if seq_str else []
+        terminals.append(t)
+    return terminals
+
+def decode_template(template_path, out_path, context="DEFAULT", verbose=False, flush_size=DEFAULT_FLUSH_SIZE, max_cached=DEFAULT_MAX_CACHED, cache_budget=DEFAULT_CACHE_BUDGET):
+    with open(template_path, "rb") as f:
+        if f.read(4) == ZSTD_MAGIC:
+            if zstd is None:
+                raise RuntimeError(f"{template_path} is zstd-compressed; install the 'zstandard' package to decode it")
+            f.seek(0)
+            with zstd.ZstdDecompressor().stream_reader(f) as reader:
+                tpl = json_loads(reader.read())
+        else:
+            f.seek(0)
+            tpl = json_loads(zlib.decompress(f.read()))
+    fmt = tpl.get("meta", {}).get("format", 1)
+    if fmt != TEMPLATE_FORMAT:
+        raise RuntimeError(f"{template_path} uses template format {fmt}, this decode.py reads format {TEMPLATE_FORMAT}; re-encode it with the matching encode.py")
+    dictionary = tpl.get("dictionary", [])
+    # flat pairs: rule n is rules[2n], rules[2n + 1]
+    rules = load_int32(tpl.get("rules", ""))
+    R = len(rules) // 2
+    seq = load_int32(tpl.get("sequence", ""))
+    if verbose:
+        print(f"[DEC] loaded template for file {tpl.get('meta',{}).get('orig_file')} chunks={tpl.get('meta',{}).get('total_chunks')}")
+        print(f"[DEC] dict entries: {len(dictionary)} rules: {R} sequence_symbols: {len(seq)}")
+    # ids [0, T) are terminals, [T, T + R) are rules
+    T = len(dictionary)
+    expand = resolve_terminals(dictionary, context) + [None] * R
+    # The rules form a DAG: memoize full expansions bottom-up so repeated
+    # rules cost a single concatenation. Re-Pair rules only refer to earlier
+    # ids, so id order is a topological order. Rules larger than max_cached,
+    # past the total cache_budget, or with an uncached child are left as None
+    # and expanded on demand.
+    cached_rules = 0
+    cached_bytes = 0
+    for n, (a, b) in enumerate(zip(rules[::2], rules[1::2])):
+        ea, eb = expand[a], expand[b]
+        if ea is None or eb is None:
+            continue
+        size = len(ea) + len(eb)
+        if size > max_cached or cached_bytes + size > cache_budget:
+            continue
+        expand[T + n] = ea + eb
+        cached_rules += 1
+        cached_bytes += size
+    if verbose:
+        print(f"[DEC] cached {cached_rules} rule expansions ({cached_bytes} bytes); {R - cached_rules} expanded on demand")
+    def emit(sid, out):
+        # explicit stack instead of recursion: no per-node bytes objects and
+        # no recursion limit on deep grammars
+        stack = [sid]
+        while stack:
+            s = stack.pop()
+            t = expand[s]
+            if t is not None:
+                out += t
+            else:
+                r = 2 * (s - T)
+                stack.append(rules[r + 1])
+                stack.append(rules[r])
     if verbose:
         print(f"[DEC] beginning expansion for {len(seq)} sequence items")
     with open(out_path, "wb") as f_out:
-        idx = 0
-        for s in seq:
-            idx += 1
-            b = expand_symbol(s)
-            f_out.write(b)
-            if verbose and idx % 1000 == 0:
-                print(f"[DEC] wrote {idx} symbols -> {f_out.tell()} bytes so far")
+        write = f_out.write
+        buf = bytearray()
+        if verbose:
+            for idx, s in enumerate(seq, 1):
+                t = expand[s]
+                if t is not None:
+                    buf += t
+                else:
+                    emit(s, buf)
+                if len(buf) >= flush_size:
+                    write(buf)
+                    buf.clear()
+                if idx % 1000 == 0:
+                    print(f"[DEC] wrote {idx} symbols -> {f_out.tell() + len(buf)} bytes so far")
+        else:
+            # hot loop: no progress counter or verbose check per symbol
+            for s in seq:
+                t = expand[s]
+                if t is not None:
+                    buf += t
+                else:
+                    emit(s, buf)
+                if len(buf) >= flush_size:
+                    write(buf)
+                    buf.clear()
+        write(buf)
     if verbose:
         print(f"[DEC] finished; output written to {out_path}; total bytes {os.path.getsize(out_path)}")
 
@@ -64,7 +156,10 @@ def main():
     ap.add_argument("--context", default="DEFAULT")
     ap.add_argument("--verbose", action="store_true")
     args = ap.parse_args()
-    decode_template(args.template, args.out, context=args.context, verbose=args.verbose)
+    try:
+        decode_template(args.template, args.out, context=args.context, verbose=args.verbose)
+    except RuntimeError as e:
+        sys.exit(f"[DEC] error: {e}")
 
 if __name__ == "__main__":
     main()
@@ -5,168 +5,409 @@ encode.py - Streaming template extractor / compressor (MVP)
 This script reads any file as a stream of raw bytes (chunks), builds a
 symbolic "score" (template) where repeated byte-chunks become symbols ("notes"),
 applies a simple hierarchical substitution (Re-Pair–like) on the symbol sequence,
-and writes a compact template (zlib-compressed JSON) that contains:
+and writes a compact template (zstd-compressed JSON when the optional
+`zstandard` package is installed, zlib-compressed otherwise) that contains:
 
- - dictionary: symbol -> { context_name: hex(chunk_bytes) }
- - rules: hierarchical rules Rn -> [a, b]
- - sequence: compressed, rule-applied symbol sequence (comma-separated)
+ - dictionary: list of { context_name: base64(chunk_bytes) }; entry i is terminal id i
+ - rules: flat rule pairs a0, b0, a1, b1, ... (base64 of little-endian int32);
+   rule n has symbol id len(dictionary) + n
+ - sequence: compressed, rule-applied symbol ids (base64 of little-endian int32)
 
 Designed as a proof-of-concept to demonstrate "notes" and streaming decoding.
 Usage:
   # Build a global dictionary from sample files (optional)
   python3 encode.py --build-dict samples/* --out global_dict.json --chunk-size 4096 --verbose
 
-  # Encode a single file (stream, two passes; never load full file into RAM)
+  # Encode a single file (single streaming pass; never load full file into RAM)
   python3 encode.py --input bigfile.bin --out template.bin --dict global_dict.json --contexts VIDEO,TEXT --chunk-size 4096 --min-pair-freq 3 --verbose
 """
-import argparse, hashlib, json, zlib, os, sys, random
+import argparse, base64, hashlib, heapq, json, mmap, zlib, os, stat, sys, random
+from array import array
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, count, groupby, islice, repeat
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    def json_dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+    json_loads = json.loads
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+try:
+    from fastcdc import fastcdc
+except ImportError:
+    fastcdc = None
 
 DEFAULT_CHUNK_SIZE = 4096
 DEFAULT_MIN_FREQ = 2
+DEFAULT_MIN_RUN = 16
+DEFAULT_ZSTD_LEVEL = 6
+# fastcdc's limits (min >= 64, avg >= 256, max >= 1024, max <= 1 GiB) for
+# min/avg/max = chunk_size / 4, chunk_size, chunk_size * 4
+CDC_MIN_CHUNK_SIZE = 256
+CDC_MAX_CHUNK_SIZE = 1 << 28
+# bumped whenever the template layout changes; decode.py checks it
+TEMPLATE_FORMAT = 2
 
 def short_hash(b):
-    return hashlib.sha256(b).hexdigest()[:12]
+    # raw 6-byte digest; hex is only produced when naming a symbol
+    return hashlib.sha256(b).digest()[:6]
 
-def stream_chunks(path, chunk_size):
+def stream_chunks(path, chunk_size, cdc=False):
+    if cdc:
+        # content-defined boundaries (FastCDC / Gear hash); chunk_size is the average
+        if fastcdc is None:
+            raise RuntimeError("content-defined chunking needs the 'fastcdc' package")
+        if not CDC_MIN_CHUNK_SIZE <= chunk_size <= CDC_MAX_CHUNK_SIZE:
+            raise RuntimeError(f"content-defined chunking needs {CDC_MIN_CHUNK_SIZE} <= chunk size <= {CDC_MAX_CHUNK_SIZE}, got {chunk_size}")
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if stat.S_ISREG(st.st_mode) and not st.st_size:
+                return
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # pipe, FIFO or /proc file: fastcdc needs the whole input as one buffer
+                data = f.read()
+                if not data:
+                    return
+            try:
+                # fat=False: only boundaries come back, so fastcdc neither copies nor
+                # hashes chunks; short_hash is the only hash per chunk
+                chunks = fastcdc(data, min_size=chunk_size // 4, avg_size=chunk_size, max_size=chunk_size * 4, fat=False)
+                try:
+                    for c in chunks:
+                        yield data[c.offset:c.offset+c.length]
+                finally:
+                    chunks.close()  # drop fastcdc's view of the mapping before it is closed
+            finally:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+        return
     with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            mm = None  # empty file, pipe or other non-mappable input
+        if mm is not None:
+            # slicing the mapping copies each chunk straight from the page
+            # cache into its bytes object, with no read() call per chunk
+            with mm:
+                for off in range(0, len(mm), chunk_size):
+                    yield mm[off:off+chunk_size]
+            return
+        # yields views into a single reused buffer: copy with bytes() before keeping one
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
         while True:
-            chunk = f.read(chunk_size)
-            if not chunk:
+            n = f.readinto(buf)
+            if not n:
                 break
-            yield chunk
+            yield view[:n]
 
-def build_global_dict(paths, out_path, chunk_size=DEFAULT_CHUNK_SIZE, min_freq=DEFAULT_MIN_FREQ, verbose=False):
+def scan_file(path, chunk_size, cdc=False):
+    # per-file chunk counts and first-seen bytes; module-level so worker processes can run it
     counts = Counter()
     sample_map = {}
-    total = 0
-    for p in paths:
-        if verbose: print(f"[DICT] scanning {p}")
-        for c in stream_chunks(p, chunk_size):
+    last_chunk = last_h = None
+    for c in stream_chunks(path, chunk_size, cdc):
+        c = bytes(c)
+        if c == last_chunk:
+            h = last_h
+        else:
             h = short_hash(c)
-            counts[h] += 1
-            if h not in sample_map:
-                sample_map[h] = c
-            total += 1
+            last_chunk, last_h = c, h
+        counts[h] += 1
+        if h not in sample_map:
+            sample_map[h] = c
+    return counts, sample_map
+
+def build_global_dict(paths, out_path, chunk_size=DEFAULT_CHUNK_SIZE, min_freq=DEFAULT_MIN_FREQ, verbose=False, workers=None, cdc=False):
+    counts = Counter()
+    sample_map = {}
+    total = 0
+    if workers is not None and workers < 1:
+        raise RuntimeError(f"--workers must be at least 1, got {workers}")
+    if workers == 1 or len(paths) < 2:
+        results = (scan_file(p, chunk_size, cdc) for p in paths)
+        ex = None
+    else:
+        ex = ProcessPoolExecutor(max_workers=workers)
+        results = ex.map(scan_file, paths, repeat(chunk_size), repeat(cdc))
+    try:
+        # results arrive in path order, so first-seen bytes match a sequential scan
+        for p, (c, m) in zip(paths, results):
+            if verbose: print(f"[DICT] scanned {p}")
+            counts.update(c)
+            total += sum(c.values())
+            for h, b in m.items():
+                sample_map.setdefault(h, b)
+    finally:
+        if ex is not None:
+            ex.shutdown()
     if verbose:
         print(f"[DICT] scanned {len(paths)} files; total chunks seen: {total}; unique chunk-hashes: {len(counts)}")
     entries = {}
     for h, cnt in counts.items():
         if cnt >= min_freq:
-            sym = "S" + h
-            entries[sym] = {"DEFAULT": sample_map[h].hex(), "freq": cnt}
-    with open(out_path, "w") as f:
-        json.dump({"meta": {"chunk_size": chunk_size, "min_freq": min_freq}, "entries": entries}, f)
+            sym = "S" + h.hex()
+            entries[sym] = {"DEFAULT": base64.b64encode(sample_map[h]).decode("ascii"), "freq": cnt}
+    with open(out_path, "wb") as f:
+        f.write(json_dumps({"meta": {"chunk_size": chunk_size, "chunking": "cdc" if cdc else "fixed", "min_freq": min_freq, "payload": "base64"}, "entries": entries}))
     if verbose:
         print(f"[DICT] wrote {len(entries)} entries to {out_path}")
     return out_path
 
-def build_hierarchical_rules(sequence, max_new_symbols=10000, min_pair_freq=2, verbose=False):
-    seq = sequence[:]
-    rules = {}
-    next_idx = 0
-    def new_sym():
-        nonlocal next_idx
-        s = f"R{next_idx}"
-        next_idx += 1
-        return s
-    while True:
-        pairs = Counter()
-        for i in range(len(seq) - 1):
-            pairs[(seq[i], seq[i+1])] += 1
-        if not pairs:
-            break
-        (a,b), freq = pairs.most_common(1)[0]
+def collapse_runs(sequence, rules, first_id, max_new_symbols, min_run=DEFAULT_MIN_RUN):
+    # Rewrite runs of one symbol as power-of-two rules (x2 -> x x, x4 -> x2 x2, ...)
+    # up to a top power 2**K, so Re-Pair never counts or splices the overlapping
+    # "aa" pairs of long constant regions. Appends to rules.
+    runs = [(x, len(list(grp))) for x, grp in groupby(sequence)]
+    lengths = defaultdict(list)
+    for x, run in runs:
+        if run > 1:
+            lengths[x].append(run)
+    # Per symbol, pick the K minimizing the grammar size: each run costs
+    # run >> K top-power symbols plus one per set bit of the remainder, and
+    # each rule costs two ids. Symbols where no K beats leaving the runs
+    # alone get no run rules and are left to Re-Pair.
+    top = {}
+    for x, lens in lengths.items():
+        if max(lens) < min_run:
+            continue
+        best_k, best_cost = 0, sum(lens)
+        for k in range(1, max(lens).bit_length()):
+            mask = (1 << k) - 1
+            cost = 2 * k + sum((run >> k) + bin(run & mask).count("1") for run in lens)
+            if cost < best_cost:
+                best_k, best_cost = k, cost
+        if best_k:
+            top[x] = best_k
+    powers = {}
+    out = []
+    for x, run in runs:
+        # short runs of a collapsed symbol reuse its powers too; left raw,
+        # Re-Pair would rebuild a duplicate of x2
+        if run == 1 or x not in top:
+            out.extend([x] * run)
+            continue
+        pw = powers.setdefault(x, [x])  # pw[k] is x repeated 2**k times
+        while len(pw) <= top[x] and len(rules) < max_new_symbols:
+            rules.append((pw[-1], pw[-1]))
+            pw.append(first_id + len(rules) - 1)
+        for k in range(len(pw) - 1, -1, -1):
+            while run >= 1 << k:
+                out.append(pw[k])
+                run -= 1 << k
+    return out
+
+def build_hierarchical_rules(sequence, first_id=None, max_new_symbols=10000, min_pair_freq=2, verbose=False):
+    # Symbols are int ids; rule n gets id first_id + n (default: past the largest input id).
+    # Re-Pair over a doubly-linked list (sym/prev/nxt) with a pair -> positions
+    # index and a lazily-invalidated max-heap: each replacement only touches the
+    # neighbours of the replaced occurrences instead of rescanning the sequence.
+    # Pair frequencies are the sizes of the position sets, updated per splice.
+    # Heap entries are (-freq, born, pair): equal frequencies pop in creation
+    # order, so newly created pairs queue behind older ones and the grammar
+    # stays balanced.
+    if first_id is None:
+        first_id = max(sequence, default=-1) + 1
+    rules = []
+    sym = collapse_runs(sequence, rules, first_id, max_new_symbols)
+    if verbose and rules:
+        print(f"[RULES] collapsed runs: {len(rules)} run rules, seq_len {len(sequence)} -> {len(sym)}")
+    n = len(sym)
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    if n:
+        nxt[-1] = -1
+    # Count the initial pairs in C; pairs of input symbols can only lose
+    # occurrences, so those already below min_pair_freq are never indexed.
+    counts = Counter(zip(sym, islice(sym, 1, None)))
+    pairs = defaultdict(set)
+    for i, p in enumerate(zip(sym, islice(sym, 1, None))):
+        if counts[p] >= min_pair_freq:
+            pairs[p].add(i)
+    del counts
+    tick = count()
+    born = {p: next(tick) for p in pairs}
+    heap = [(-len(pos), born[p], p) for p, pos in pairs.items()]
+    heapq.heapify(heap)
+    def add_pair(i):
+        j = nxt[i]
+        if j < 0:
+            return
+        p = (sym[i], sym[j])
+        if p not in born:
+            born[p] = next(tick)
+        pos = pairs[p]
+        pos.add(i)
+        heapq.heappush(heap, (-len(pos), born[p], p))
+    def discard_pair(i):
+        j = nxt[i]
+        if i < 0 or j < 0:
+            return
+        p = (sym[i], sym[j])
+        pos = pairs.get(p)
+        if pos is not None:
+            pos.discard(i)
+            if not pos:
+                del pairs[p]
+                del born[p]
+    seq_len = n
+    while heap:
+        neg_freq, b_tick, (a,b) = heapq.heappop(heap)
+        pos = pairs.get((a,b))
+        if not pos or born[(a,b)] != b_tick:
+            continue
+        freq = len(pos)
+        if freq != -neg_freq:
+            # stale entry: re-queue if the pair shrank, a fresher one exists if it grew
+            if freq < -neg_freq:
+                heapq.heappush(heap, (-freq, b_tick, (a,b)))
+            continue
         if freq < min_pair_freq or len(rules) >= max_new_symbols:
             if verbose: print(f"[RULES] stopping: top pair freq {freq}, threshold {min_pair_freq}")
             break
-        ns = new_sym()
-        rules[ns] = [a, b]
-        new_seq = []
-        i = 0
-        while i < len(seq):
-            if i < len(seq)-1 and seq[i] == a and seq[i+1] == b:
-                new_seq.append(ns)
-                i += 1
-                i += 1
-            else:
-                new_seq.append(seq[i])
-                i += 1
-        seq = new_seq
+        ns = first_id + len(rules)
+        rules.append((a, b))
+        del pairs[(a,b)]
+        del born[(a,b)]
+        for i in sorted(pos):
+            j = nxt[i]
+            # overlapping "aa" occurrences may already have been consumed
+            if sym[i] != a or j < 0 or sym[j] != b:
+                continue
+            h, k = prev[i], nxt[j]
+            discard_pair(h)
+            discard_pair(j)
+            sym[i] = ns
+            sym[j] = -1
+            nxt[i] = k
+            if k >= 0:
+                prev[k] = i
+            if h >= 0:
+                add_pair(h)
+            add_pair(i)
+            seq_len -= 1
         if verbose:
-            print(f"[RULES] created {ns} -> ({a},{b}) frequency={freq} seq_len={len(seq)} rules={len(rules)}")
+            print(f"[RULES] created {ns} -> ({a},{b}) frequency={freq} seq_len={seq_len} rules={len(rules)}")
+    seq = []
+    i = 0 if n else -1
+    while i >= 0:
+        seq.append(sym[i])
+        i = nxt[i]
     return seq, rules
 
-def encode_file(input_path, out_path, dict_path=None, contexts=["DEFAULT"], chunk_size=DEFAULT_CHUNK_SIZE, verbose=False, min_pair_freq=2):
+def int32_le(values):
+    arr = array("i", values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+def iter_b64(arr, step=3 << 18):
+    # step is a multiple of 3, so the base64 blocks concatenate without padding
+    raw = memoryview(arr).cast("B")
+    for off in range(0, len(raw), step):
+        yield base64.b64encode(raw[off:off+step])
+
+def iter_template_json(meta, dictionary, rules_arr, seq_arr, batch=4096):
+    # JSON text of the template in pieces, so the whole document never exists at once
+    yield b'{"meta":' + json_dumps(meta) + b',"dictionary":['
+    for i in range(0, len(dictionary), batch):
+        yield (b"," if i else b"") + json_dumps(dictionary[i:i+batch])[1:-1]
+    yield b'],"rules":"'
+    yield from iter_b64(rules_arr)
+    yield b'","sequence":"'
+    yield from iter_b64(seq_arr)
+    yield b'"}'
+
+def write_template(out_path, pieces):
+    # compress pieces as they are produced; returns the compressed size
+    with open(out_path, "wb") as f:
+        if zstd is not None:
+            with zstd.ZstdCompressor(level=DEFAULT_ZSTD_LEVEL).stream_writer(f, closefd=False) as w:
+                for p in pieces:
+                    w.write(p)
+        else:
+            c = zlib.compressobj()
+            for p in pieces:
+                f.write(c.compress(p))
+            f.write(c.flush())
+        return f.tell()
+
+def encode_file(input_path, out_path, dict_path=None, contexts=["DEFAULT"], chunk_size=DEFAULT_CHUNK_SIZE, verbose=False, min_pair_freq=2, cdc=False):
     global_dict = {}
     if dict_path:
         if verbose: print(f"[ENC] loading dict {dict_path}")
-        with open(dict_path, "r") as f:
-            j = json.load(f)
+        with open(dict_path, "rb") as f:
+            j = json_loads(f.read())
+            dict_meta = j.get("meta", {})
+            if (dict_meta.get("chunking", "fixed") == "cdc") != cdc or dict_meta.get("chunk_size", chunk_size) != chunk_size:
+                print(f"[ENC] warning: {dict_path} was built with different chunking; its entries will not match")
+            # dictionaries from before the base64 switch carry hex payloads and
+            # no marker; hex is also valid base64, so convert rather than guess
+            legacy_hex = dict_meta.get("payload") != "base64"
+            if legacy_hex and verbose: print(f"[ENC] {dict_path} has hex payloads; converting to base64")
             for sym,info in j.get("entries", {}).items():
-                global_dict[sym] = {k: v for k, v in info.items() if k != "freq"}
+                if legacy_hex:
+                    global_dict[sym] = {k: base64.b64encode(bytes.fromhex(v)).decode("ascii") for k, v in info.items() if k != "freq"}
+                else:
+                    global_dict[sym] = {k: v for k, v in info.items() if k != "freq"}
         if verbose: print(f"[ENC] loaded {len(global_dict)} dictionary entries")
-    hash_to_sym = {}
-    for sym in global_dict.keys():
-        if sym.startswith("S"):
-            h = sym[1:]
-            hash_to_sym[h] = sym
+    hash_to_sym = {bytes.fromhex(sym[1:]): sym for sym in global_dict if sym.startswith("S")}
+    # terminal ids are assigned on first use, so only global entries the input
+    # references are copied into the template
+    template_dict = []
+    ids = {}
+    from_global = 0
     sequence = []
-    local_symbol_map = {}
     total_chunks = 0
-    if verbose: print(f"[ENC] streaming input {input_path} chunk_size={chunk_size}")
-    for chunk in stream_chunks(input_path, chunk_size):
-        h = short_hash(chunk)
-        total_chunks += 1
-        sym = None
-        if h in hash_to_sym:
-            sym = hash_to_sym[h]
-            if verbose:
-                print(f"[ENC] chunk#{total_chunks} hash {h} -> global sym {sym}")
+    if verbose: print(f"[ENC] streaming input {input_path} chunk_size={chunk_size} cdc={cdc}")
+    # runs of identical chunks (padding, zero-fill) are compared, not re-hashed;
+    # bytes == bytes is a memcmp, whereas comparing memoryviews goes item by item
+    last_chunk = last_h = None
+    for chunk in stream_chunks(input_path, chunk_size, cdc):
+        chunk = bytes(chunk)
+        if chunk == last_chunk:
+            h = last_h
         else:
-            if h in local_symbol_map:
-                sym = local_symbol_map[h]
+            h = short_hash(chunk)
+            last_chunk, last_h = chunk, h
+        total_chunks += 1
+        sid = ids.get(h)
+        if sid is None:
+            sid = len(template_dict)
+            ids[h] = sid
+            if h in hash_to_sym:
+                template_dict.append(global_dict[hash_to_sym[h]])
+                from_global += 1
+            else:
+                b64 = base64.b64encode(chunk).decode("ascii")
+                template_dict.append({ctx: b64 for ctx in contexts})
+                if verbose: print(f"[ENC] local sym L{h.hex()} id {sid} <- collected {len(chunk)} bytes")
+        if verbose:
+            if h in hash_to_sym:
+                print(f"[ENC] chunk#{total_chunks} hash {h.hex()} -> global sym {hash_to_sym[h]} id {sid}")
             else:
-                sym = "L" + h
-                local_symbol_map[h] = sym
-            if verbose:
-                print(f"[ENC] chunk#{total_chunks} hash {h} -> local sym {sym}")
-        sequence.append(sym)
+                print(f"[ENC] chunk#{total_chunks} hash {h.hex()} -> local sym L{h.hex()} id {sid}")
+        sequence.append(sid)
     if verbose:
-        print(f"[ENC] produced initial symbol sequence length {len(sequence)} (chunks={total_chunks})")
-    template_dict = defaultdict(dict)
-    for sym, m in global_dict.items():
-        template_dict[sym].update(m)
-    if local_symbol_map:
-        if verbose: print("[ENC] collecting bytes for local symbols (second streaming pass)")
-        seen = set()
-        for chunk in stream_chunks(input_path, chunk_size):
-            h = short_hash(chunk)
-            if h in local_symbol_map and h not in seen:
-                sym = local_symbol_map[h]
-                for ctx in contexts:
-                    template_dict[sym][ctx] = chunk.hex()
-                seen.add(h)
-                if verbose: print(f"[ENC] symbol {sym} <- collected {len(chunk)} bytes")
-            if len(seen) == len(set(local_symbol_map.values())):
-                break
-    seq_after, rules = build_hierarchical_rules(sequence, min_pair_freq=min_pair_freq, verbose=verbose)
-    out_dict = {k: v for k, v in template_dict.items()}
-    template_obj = {
-        "meta": {
-            "chunk_size": chunk_size,
-            "orig_file": os.path.basename(input_path),
-            "total_chunks": total_chunks
-        },
-        "dictionary": out_dict,
-        "rules": rules,
-        "sequence": ",".join(seq_after)
+        print(f"[ENC] produced initial symbol sequence length {len(sequence)} (chunks={total_chunks}); dictionary entries {len(template_dict)} ({from_global} from global dict)")
+    seq_after, rules = build_hierarchical_rules(sequence, first_id=len(template_dict), min_pair_freq=min_pair_freq, verbose=verbose)
+    meta = {
+        "format": TEMPLATE_FORMAT,
+        "chunk_size": chunk_size,
+        "chunking": "cdc" if cdc else "fixed",
+        "orig_file": os.path.basename(input_path),
+        "total_chunks": total_chunks
     }
-    blob = zlib.compress(json.dumps(template_obj).encode("utf-8"))
-    with open(out_path, "wb") as f:
-        f.write(blob)
+    size = write_template(out_path, iter_template_json(meta, template_dict, int32_le(chain.from_iterable(rules)), int32_le(seq_after)))
     if verbose:
-        print(f"[ENC] template written to {out_path} (compressed {len(blob)} bytes)")
+        print(f"[ENC] template written to {out_path} (compressed {size} bytes)")
     return out_path
 
 def main():
@@ -176,20 +417,25 @@ def main():
     ap.add_argument("--input", help="input file to encode")
     ap.add_argument("--out", help="output template path (binary)")
     ap.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    ap.add_argument("--cdc", action="store_true", help="content-defined chunking (FastCDC, needs the 'fastcdc' package); --chunk-size is the average chunk size")
     ap.add_argument("--min-pair-freq", type=int, default=2)
     ap.add_argument("--contexts", default="DEFAULT", help="comma-separated contexts to include (e.g. TEXT,VIDEO)")
+    ap.add_argument("--workers", type=int, help="processes used to scan --build-dict files (default: one per CPU)")
     ap.add_argument("--verbose", action="store_true")
     args = ap.parse_args()
     if args.build_dict:
         out = args.dict if args.dict else "global_dict.json"
-        build_global_dict(args.build_dict, out, chunk_size=args.chunk_size, min_freq=DEFAULT_MIN_FREQ, verbose=args.verbose)
+        build_global_dict(args.build_dict, out, chunk_size=args.chunk_size, min_freq=DEFAULT_MIN_FREQ, verbose=args.verbose, workers=args.workers, cdc=args.cdc)
         print(f"Global dict saved to {out}")
         return
     if not args.input or not args.out:
         print("Need --input and --out (or --build-dict). Use --help for details.")
         return
     contexts = [c.strip() for c in args.contexts.split(",") if c.strip()]
-    encode_file(args.input, args.out, dict_path=args.dict, contexts=contexts, chunk_size=args.chunk_size, verbose=args.verbose, min_pair_freq=args.min_pair_freq)
+    encode_file(args.input, args.out, dict_path=args.dict, contexts=contexts, chunk_size=args.chunk_size, verbose=args.verbose, min_pair_freq=args.min_pair_freq, cdc=args.cdc)
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    except RuntimeError as e:
+        sys.exit(f"[ENC] error: {e}")